@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import threading
+import time
+from http import HTTPStatus
+from typing import Any, Callable, Sequence
+
+from app.core.exceptions import QwenClientError
+
+Clock = Callable[[], float]
+
+KEY_POOL_STRATEGIES = ("round_robin", "quota")
+# DashScope 限流/欠费/鉴权类错误：换其他 key 可以继续服务，当前 key 需要暂时下线。
+_SIDELINE_STATUS_CODES = {
+    HTTPStatus.UNAUTHORIZED,
+    HTTPStatus.FORBIDDEN,
+    HTTPStatus.TOO_MANY_REQUESTS,
+}
+_SIDELINE_CODE_PREFIXES = ("InvalidApiKey", "Throttling", "Arrearage", "AccessDenied")
+
+
+def _mask_key(index: int, api_key: str) -> str:
+    # 带上池内下标保证唯一；短 key 不露出后缀，避免整段泄露。
+    suffix = api_key[-4:] if len(api_key) > 8 else ""
+    return f"{index}:...{suffix}"
+
+
+def should_sideline(error: QwenClientError) -> bool:
+    if error.status_code in _SIDELINE_STATUS_CODES:
+        return True
+    return bool(error.code) and str(error.code).startswith(_SIDELINE_CODE_PREFIXES)
+
+
+class ApiKeyPool:
+    """线程安全的多 key 池：按轮询或剩余配额分配，出错的 key 冷却一段时间。
+
+    ``quotas`` 为每个 key 在一个 ``quota_window_seconds`` 窗口内的请求配额，窗口到期后
+    统一补满；也可以随时用 ``set_remaining_quota`` 按服务端额度校准。
+    """
+
+    def __init__(
+        self,
+        api_keys: Sequence[str],
+        *,
+        strategy: str = "round_robin",
+        quotas: dict[str, int] | None = None,
+        cooldown_seconds: float = 60.0,
+        quota_window_seconds: float | None = None,
+        clock: Clock = time.monotonic,
+    ) -> None:
+        if not api_keys:
+            raise ValueError("api_keys must not be empty")
+        if strategy not in KEY_POOL_STRATEGIES:
+            raise ValueError(f"strategy must be one of {KEY_POOL_STRATEGIES}")
+
+        self._api_keys = list(dict.fromkeys(api_keys))
+        self._strategy = strategy
+        self._quotas = dict(quotas or {})
+        self._cooldown_seconds = cooldown_seconds
+        self._quota_window_seconds = quota_window_seconds
+        self._clock = clock
+        self._window_started_at = clock()
+        self._next_index = 0
+        self._requests = {key: 0 for key in self._api_keys}
+        self._remaining = dict(self._quotas)
+        self._failures = {key: 0 for key in self._api_keys}
+        self._sidelined_until = {key: 0.0 for key in self._api_keys}
+        self._lock = threading.Lock()
+
+    def acquire(self) -> str:
+        """取出一个可用 key 并计入请求数。
+
+        配额全部耗尽时在未冷却的 key 之间轮询分摊；全部冷却中时选最早恢复的 key。
+        """
+        with self._lock:
+            now = self._clock()
+            self._refill_quotas(now)
+            ready = [key for key in self._api_keys if self._sidelined_until[key] <= now]
+            available = [key for key in ready if self._remaining_quota(key) > 0]
+            if available and self._strategy == "quota":
+                key = max(available, key=self._remaining_quota)
+            elif available:
+                key = self._next_round_robin(available)
+            elif ready:
+                key = self._next_round_robin(ready)
+            else:
+                key = min(self._api_keys, key=self._sidelined_until.__getitem__)
+            self._requests[key] += 1
+            if key in self._remaining:
+                self._remaining[key] -= 1
+            return key
+
+    def set_remaining_quota(self, api_key: str, remaining: int) -> None:
+        """按服务端返回的剩余额度校准当前窗口内的配额，窗口到期后仍按 quotas 补满。"""
+        with self._lock:
+            if api_key in self._requests:
+                self._remaining[api_key] = remaining
+
+    def report_failure(self, api_key: str, error: QwenClientError) -> None:
+        with self._lock:
+            if api_key not in self._failures:
+                return
+            self._failures[api_key] += 1
+            if should_sideline(error):
+                self._sidelined_until[api_key] = self._clock() + self._cooldown_seconds
+
+    def usage(self) -> dict[str, dict[str, Any]]:
+        """按脱敏后的 key 汇总请求数、失败数、剩余配额和是否冷却中。"""
+        with self._lock:
+            now = self._clock()
+            self._refill_quotas(now)
+            return {
+                _mask_key(index, key): {
+                    "requests": self._requests[key],
+                    "failures": self._failures[key],
+                    "remaining_quota": (
+                        self._remaining[key] if key in self._remaining else None
+                    ),
+                    "sidelined": self._sidelined_until[key] > now,
+                }
+                for index, key in enumerate(self._api_keys)
+            }
+
+    def _remaining_quota(self, api_key: str) -> float:
+        return self._remaining.get(api_key, float("inf"))
+
+    def _refill_quotas(self, now: float) -> None:
+        if self._quota_window_seconds is None:
+            return
+        if now - self._window_started_at < self._quota_window_seconds:
+            return
+        self._window_started_at = now
+        self._remaining.update(self._quotas)
+
+    def _next_round_robin(self, available: list[str]) -> str:
+        # 从上次位置继续向后找第一个可用 key，保证冷却 key 恢复后仍按顺序轮转。
+        total = len(self._api_keys)
+        for offset in range(total):
+            key = self._api_keys[(self._next_index + offset) % total]
+            if key in available:
+                self._next_index = (self._next_index + offset + 1) % total
+                return key
+        return available[0]
@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import logging
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable
+
+Clock = Callable[[], float]
+
+COMMAND_PARSER_LOGGER = "app.services.command_parser"
+SUPPRESSED_SUMMARY_EVENT = "command_parser.suppressed"
+_DEFAULT_FAILURE_TYPE = "other"
+
+
+def _failure_type(record: logging.LogRecord) -> str:
+    return str(getattr(record, "failure_type", _DEFAULT_FAILURE_TYPE))
+
+
+def _summary_record(logger_name: str, failure_type: str, count: int) -> logging.LogRecord:
+    record = logging.LogRecord(
+        logger_name,
+        logging.WARNING,
+        __file__,
+        0,
+        f"{SUPPRESSED_SUMMARY_EVENT} ({count} suppressed)",
+        None,
+        None,
+    )
+    record.failure_type = failure_type
+    record.suppressed = count
+    return record
+
+
+class TokenBucket:
+    """经典令牌桶：按 rate 每秒补充令牌，最多积累 capacity 个。"""
+
+    def __init__(self, rate: float, capacity: float, *, clock: Clock = time.monotonic) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._clock = clock
+        self._updated_at = clock()
+
+    def consume(self) -> bool:
+        now = self._clock()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._tokens = min(self._capacity, self._tokens + elapsed * self._rate)
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class FailureLogThrottle(logging.Filter):
+    """按 failure_type 采样并限流，被丢弃的条数累计到下一条放行记录的 suppressed 字段。"""
+
+    def __init__(
+        self,
+        *,
+        sample_rates: dict[str, float] | None = None,
+        rate: float = 10.0,
+        burst: float = 20.0,
+        clock: Clock = time.monotonic,
+        rng: Callable[[], float] = random.random,
+    ) -> None:
+        super().__init__()
+        self._sample_rates = dict(sample_rates or {})
+        self._rate = rate
+        self._burst = burst
+        self._clock = clock
+        self._rng = rng
+        self._buckets: dict[str, TokenBucket] = {}
+        self._suppressed: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        failure_type = _failure_type(record)
+        sample_rate = self._sample_rates.get(failure_type, 1.0)
+
+        with self._lock:
+            bucket = self._buckets.get(failure_type)
+            if bucket is None:
+                bucket = TokenBucket(self._rate, self._burst, clock=self._clock)
+                self._buckets[failure_type] = bucket
+
+            if self._rng() >= sample_rate or not bucket.consume():
+                self._suppressed[failure_type] = self._suppressed.get(failure_type, 0) + 1
+                return False
+
+            suppressed = self._suppressed.pop(failure_type, 0)
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+    def record_suppressed(self, failure_type: str, count: int = 1) -> None:
+        with self._lock:
+            self._suppressed[failure_type] = self._suppressed.get(failure_type, 0) + count
+
+    def drain_suppressed(self) -> dict[str, int]:
+        """取出并清空尚未随日志上报的丢弃计数。"""
+        with self._lock:
+            suppressed, self._suppressed = self._suppressed, {}
+        return suppressed
+
+
+class ThrottledQueueHandler(QueueHandler):
+    """非阻塞入队：队列满时直接丢弃并计入 suppressed，不让请求线程等待 IO。"""
+
+    def __init__(
+        self,
+        log_queue: queue.Queue[logging.LogRecord],
+        throttle: FailureLogThrottle,
+    ) -> None:
+        super().__init__(log_queue)
+        self.throttle = throttle
+        self.addFilter(throttle)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        prepared = super().prepare(record)
+        suppressed = getattr(prepared, "suppressed", 0)
+        if suppressed:
+            prepared.msg = f"{prepared.msg} ({suppressed} suppressed)"
+            prepared.message = prepared.msg
+        return prepared
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # 放行记录已带走之前累计的丢弃数，入队失败时要连同它们一起记回去。
+            self.throttle.record_suppressed(
+                _failure_type(record),
+                1 + getattr(record, "suppressed", 0),
+            )
+
+
+class SummaryQueueListener(QueueListener):
+    """在日志线程里按 flush_interval 定期输出丢弃汇总，调用方无需自己调度。"""
+
+    def __init__(
+        self,
+        log_queue: queue.Queue[logging.LogRecord],
+        *handlers: logging.Handler,
+        throttle: FailureLogThrottle,
+        logger_name: str,
+        flush_interval: float = 10.0,
+        clock: Clock = time.monotonic,
+    ) -> None:
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self._throttle = throttle
+        self._logger_name = logger_name
+        self._flush_interval = flush_interval
+        self._clock = clock
+        self._next_flush = clock() + flush_interval
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        # 风暴结束后队列可能长期为空，用带超时的 get 保证汇总按时输出。
+        while True:
+            timeout = max(0.0, self._next_flush - self._clock())
+            try:
+                record = self.queue.get(block, timeout)
+            except queue.Empty:
+                self.flush_suppressed()
+                continue
+            if self._clock() >= self._next_flush:
+                self.flush_suppressed()
+            return record
+
+    def enqueue_sentinel(self) -> None:
+        # 基类用 put_nowait，风暴中队列满时 stop() 会抛 Full 并留下后台线程。
+        self.queue.put(self._sentinel)
+
+    def flush_suppressed(self) -> None:
+        self._next_flush = self._clock() + self._flush_interval
+        for failure_type, count in self._throttle.drain_suppressed().items():
+            self.handle(_summary_record(self._logger_name, failure_type, count))
+
+
+class AsyncFailureLogging:
+    """configure_async_failure_logging 的句柄，stop() 会撤销配置并输出剩余汇总。"""
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        handler: ThrottledQueueHandler,
+        listener: SummaryQueueListener,
+    ) -> None:
+        self.logger = logger
+        self.handler = handler
+        self.listener = listener
+        self._propagate = logger.propagate
+        self._stopped = False
+
+    def stop(self) -> None:
+        if self._stopped:
+            return
+        self._stopped = True
+
+        self.logger.removeHandler(self.handler)
+        self.logger.propagate = self._propagate
+        if _active.get(self.logger.name) is self:
+            del _active[self.logger.name]
+
+        # 先排空队列并停掉线程，剩余汇总再由当前线程写出，保证风暴结束后计数不丢。
+        self.listener.stop()
+        self.listener.flush_suppressed()
+
+
+_active: dict[str, AsyncFailureLogging] = {}
+
+
+def configure_async_failure_logging(
+    *handlers: logging.Handler,
+    logger_name: str = COMMAND_PARSER_LOGGER,
+    max_queue_size: int = 1000,
+    sample_rates: dict[str, float] | None = None,
+    rate: float = 10.0,
+    burst: float = 20.0,
+    flush_interval: float = 10.0,
+) -> AsyncFailureLogging:
+    """把 logger 的输出改为经有界队列异步写入 handlers，返回已启动的句柄。
+
+    logger 不再向上传播，避免根 logger 上的同步 handler 仍在请求线程里写日志；
+    丢弃汇总每隔 flush_interval 秒由日志线程输出。重复调用会先停掉同一 logger 上的
+    旧配置。调用方负责在退出时 ``stop()``。
+    """
+    previous = _active.get(logger_name)
+    if previous is not None:
+        previous.stop()
+
+    log_queue: queue.Queue[logging.LogRecord] = queue.Queue(maxsize=max_queue_size)
+    throttle = FailureLogThrottle(sample_rates=sample_rates, rate=rate, burst=burst)
+    queue_handler = ThrottledQueueHandler(log_queue, throttle)
+    listener = SummaryQueueListener(
+        log_queue,
+        *handlers,
+        throttle=throttle,
+        logger_name=logger_name,
+        flush_interval=flush_interval,
+    )
+
+    target_logger = logging.getLogger(logger_name)
+    for handler in list(target_logger.handlers):
+        if isinstance(handler, ThrottledQueueHandler):
+            target_logger.removeHandler(handler)
+
+    configured = AsyncFailureLogging(target_logger, queue_handler, listener)
+    target_logger.addHandler(queue_handler)
+    target_logger.propagate = False
+    listener.start()
+    _active[logger_name] = configured
+    return configured
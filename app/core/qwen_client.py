@@ -4,6 +4,7 @@ import os
 from http import HTTPStatus
 from typing import Any, Callable
 
+from app.core.api_key_pool import ApiKeyPool
 from app.core.exceptions import QwenClientError
 
 Message = dict[str, str]
@@ -21,18 +22,24 @@ class QwenClient:
         top_p: float = 0.9,
         max_tokens: int = 2000,
         generation_call: GenerationCall | None = None,
+        api_key_pool: ApiKeyPool | None = None,
     ) -> None:
-        resolved_api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
-        if not resolved_api_key:
-            raise ValueError("DASHSCOPE_API_KEY is required")
+        if api_key is not None and api_key_pool is not None:
+            raise ValueError("api_key and api_key_pool are mutually exclusive")
+
+        if api_key_pool is None:
+            resolved_api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
+            if not resolved_api_key:
+                raise ValueError("DASHSCOPE_API_KEY is required")
+            api_key_pool = ApiKeyPool([resolved_api_key])
 
         if generation_call is None:
             import dashscope
 
-            dashscope.api_key = resolved_api_key
             generation_call = dashscope.Generation.call
 
-        self._api_key = resolved_api_key
+        # key 随每次请求传入，不写 dashscope.api_key 全局变量，多个客户端可并发共存。
+        self._api_key_pool = api_key_pool
         self._model = model
         self._system_prompt = system_prompt
         self._temperature = temperature
@@ -49,12 +56,33 @@ class QwenClient:
         top_p: float | None = None,
         max_tokens: int | None = None,
     ) -> str:
+        content, _ = self.chat_with_usage(
+            messages,
+            system_prompt=system_prompt,
+            temperature=temperature,
+            top_p=top_p,
+            max_tokens=max_tokens,
+        )
+        return content
+
+    def chat_with_usage(
+        self,
+        messages: list[Message],
+        *,
+        system_prompt: str | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+        max_tokens: int | None = None,
+    ) -> tuple[str, int | None]:
+        """与 chat 相同，额外返回 DashScope 上报的输出 token 数（缺失时为 None）。"""
         payload_messages = list(messages)
         prompt = system_prompt if system_prompt is not None else self._system_prompt
         if prompt is not None:
             payload_messages = [{"role": "system", "content": prompt}, *payload_messages]
 
+        api_key = self._api_key_pool.acquire()
         response = self._generation_call(
+            api_key=api_key,
             model=self._model,
             messages=payload_messages,
             result_format="message",
@@ -64,13 +92,16 @@ class QwenClient:
         )
 
         if response.status_code != HTTPStatus.OK:
-            raise QwenClientError(
+            error = QwenClientError(
                 code=response.code,
                 message=response.message,
                 status_code=response.status_code,
             )
+            self._api_key_pool.report_failure(api_key, error)
+            raise error
 
-        return response.output.choices[0].message.content
+        output_tokens = getattr(getattr(response, "usage", None), "output_tokens", None)
+        return response.output.choices[0].message.content, output_tokens
 
     def ask(
         self,
@@ -88,3 +119,20 @@ class QwenClient:
             top_p=top_p,
             max_tokens=max_tokens,
         )
+
+    def ask_with_usage(
+        self,
+        prompt: str,
+        *,
+        system_prompt: str | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+        max_tokens: int | None = None,
+    ) -> tuple[str, int | None]:
+        return self.chat_with_usage(
+            [{"role": "user", "content": prompt}],
+            system_prompt=system_prompt,
+            temperature=temperature,
+            top_p=top_p,
+            max_tokens=max_tokens,
+        )
@@ -3,7 +3,8 @@ from __future__ import annotations
 import json
 import logging
 import re
-from typing import Any
+import time
+from typing import Any, Callable, Iterable
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +30,11 @@ VALID_ACTION_PREFIXES = ("设置", "查询")
 VALID_QUANTITIES = {"one", "all", "any", "except"}
 _FALLBACK_COMMAND = {"a": "UNKNOWN", "s": "*", "n": "*", "t": "Unknown", "q": "one"}
 
+OUTPUT_FORMATS = ("json", "compact")
+# 紧凑格式中数量字段使用单字符代码，类型使用 allowed_categories 中的下标。
+COMPACT_QUANTITY_CODES = {"o": "one", "a": "all", "y": "any", "e": "except"}
+_COMPACT_FIELD_SEPARATOR = "|"
+
 # 通过提示词约束输出形状，便于后续做严格校验。
 _SYSTEM_PROMPT = """
 你是智能家居用户指令解析器。
@@ -48,6 +54,24 @@ _SYSTEM_PROMPT = """
 12) 完全无法解析时输出：[{{"a":"UNKNOWN","s":"*","n":"*","t":"Unknown","q":"one"}}]。
 """.strip()
 
+# 紧凑行格式：省略字段名、类型用编号，显著减少模型输出 token。
+_COMPACT_SYSTEM_PROMPT = """
+你是智能家居用户指令解析器。
+请严格遵守以下规则：
+1) 每条指令输出一行，不解释、不要代码块、不要多余文本。
+2) 每行字段用 | 分隔，按顺序为：动作|房间|设备名|类型编号|数量代码[|个数]。
+3) 动作：固定动作仅可为 打开/关闭/静音/取消静音；
+   设置动作必须是 设置<属性>=<值>；查询动作必须是 查询<属性>。
+4) 房间：未知用 *；多房间可用 ","；排除房间用 "!" 前缀。
+5) 设备名：未知用 *；泛指类型使用中文原文（如 灯/插座/空调/窗帘）。
+6) 类型编号只能是：{category_codes}；不确定用 {unknown_code}。
+7) 数量代码：o=one,a=all,y=any,e=except；泛指类型默认 a；不确定用 o。
+8) 个数仅在数量明确时输出为整数，否则省略该字段及其前面的 |。
+9) 多动作/多目标要拆成多行并按语序输出；每行仅含一个动作和一个目标。
+10) 指代词（它/那个/刚才那个）且目标不明确时，保留动作，输出 动作|*|*|{unknown_code}|o。
+11) 完全无法解析时输出：UNKNOWN|*|*|{unknown_code}|o
+""".strip()
+
 
 def compact_json_dumps(payload: Any) -> str:
     """输出紧凑 JSON，避免无意义空白。"""
@@ -93,36 +117,43 @@ def _is_valid_count(value: object) -> bool:
     return isinstance(value, int) and not isinstance(value, bool)
 
 
-def _validate_command(command: object, allowed_categories: set[str]) -> bool:
+def _command_errors(command: object, allowed_categories: set[str]) -> list[str]:
+    """返回单条指令的全部校验错误，供部分接受模式上报和修复请求使用。"""
     if not isinstance(command, dict):
-        return False
+        return ["not_object"]
 
+    errors: list[str] = []
     command_keys = set(command)
-    if command_keys - set(ALLOWED_FIELDS):
-        return False
+    for field in sorted(command_keys - set(ALLOWED_FIELDS), key=str):
+        errors.append(f"unknown_field:{field}")
 
-    if not set(REQUIRED_FIELDS).issubset(command_keys):
-        return False
+    for field in REQUIRED_FIELDS:
+        if field not in command_keys:
+            errors.append(f"missing_field:{field}")
 
-    if not _is_valid_action(command.get("a")):
-        return False
+    if "a" in command and not _is_valid_action(command["a"]):
+        errors.append("invalid_a")
 
-    if not _is_valid_nonempty_str(command.get("s")):
-        return False
+    if "s" in command and not _is_valid_nonempty_str(command["s"]):
+        errors.append("invalid_s")
 
-    if not _is_valid_nonempty_str(command.get("n")):
-        return False
+    if "n" in command and not _is_valid_nonempty_str(command["n"]):
+        errors.append("invalid_n")
 
-    if not _is_valid_category(command.get("t"), allowed_categories):
-        return False
+    if "t" in command and not _is_valid_category(command["t"], allowed_categories):
+        errors.append("invalid_t")
 
-    if not _is_valid_quantity(command.get("q")):
-        return False
+    if "q" in command and not _is_valid_quantity(command["q"]):
+        errors.append("invalid_q")
 
     if "c" in command and not _is_valid_count(command["c"]):
-        return False
+        errors.append("invalid_c")
 
-    return True
+    return errors
+
+
+def _validate_command(command: object, allowed_categories: set[str]) -> bool:
+    return not _command_errors(command, allowed_categories)
 
 
 def _validate_commands(commands: object, allowed_categories: set[str]) -> bool:
@@ -163,21 +194,96 @@ def _extract_json(raw_response: object) -> list[dict[str, Any]] | None:
     return None
 
 
-def parse_commands(
+def _decode_compact(
+    raw_response: object,
+    allowed_categories: tuple[str, ...],
+) -> list[dict[str, Any]] | None:
+    """把紧凑行格式还原成与 JSON 格式一致的 dict 契约，交给同一套校验。"""
+    if not isinstance(raw_response, str):
+        return None
+
+    commands: list[dict[str, Any]] = []
+    for line in raw_response.strip().splitlines():
+        line = line.strip()
+        if not line or line.startswith("```"):
+            continue
+
+        fields = [field.strip() for field in line.split(_COMPACT_FIELD_SEPARATOR)]
+        if len(fields) not in (5, 6):
+            return None
+
+        action, room, name, category_code, quantity_code = fields[:5]
+        command: dict[str, Any] = {
+            "a": action,
+            "s": room,
+            "n": name,
+            "t": _decode_compact_category(category_code, allowed_categories),
+            "q": COMPACT_QUANTITY_CODES.get(quantity_code, quantity_code),
+        }
+        if len(fields) == 6:
+            try:
+                command["c"] = int(fields[5])
+            except ValueError:
+                return None
+        commands.append(command)
+
+    return commands
+
+
+def _decode_compact_category(code: str, allowed_categories: tuple[str, ...]) -> str:
+    # 兼容模型直接输出类型全名的情况；非法编号原样返回，由校验拦截。
+    if code.isdecimal() and int(code) < len(allowed_categories):
+        return allowed_categories[int(code)]
+    return code
+
+
+def _build_system_prompt(output_format: str, allowed_categories: tuple[str, ...]) -> str:
+    if output_format == "json":
+        return _SYSTEM_PROMPT.format(categories=", ".join(allowed_categories))
+
+    if output_format == "compact":
+        if "Unknown" in allowed_categories:
+            unknown_code = str(allowed_categories.index("Unknown"))
+        else:
+            unknown_code = "Unknown"
+        return _COMPACT_SYSTEM_PROMPT.format(
+            category_codes=",".join(
+                f"{index}={category}" for index, category in enumerate(allowed_categories)
+            ),
+            unknown_code=unknown_code,
+        )
+
+    raise ValueError(f"output_format must be one of {OUTPUT_FORMATS}")
+
+
+def _decode_response(
+    output_format: str,
+    raw_response: object,
+    allowed_categories: tuple[str, ...],
+) -> list[dict[str, Any]] | None:
+    if output_format == "compact":
+        return _decode_compact(raw_response, allowed_categories)
+    return _extract_json(raw_response)
+
+
+def _request_commands(
     client: Any,
     text: str,
     *,
-    allowed_categories: set[str] | tuple[str, ...] = ALLOWED_CATEGORIES,
-    temperature: float = 0,
-    top_p: float = 0.9,
-    max_tokens: int = 512,
-) -> list[dict[str, Any]]:
-    # 校验时统一使用 set，避免重复创建和线性查找。
-    allowed_categories_set = set(allowed_categories)
-    system_prompt = _SYSTEM_PROMPT.format(
-        categories=", ".join(allowed_categories),
-    )
-
+    system_prompt: str,
+    output_format: str,
+    allowed_categories: tuple[str, ...],
+    temperature: float,
+    top_p: float,
+    max_tokens: int,
+    log_text: str | None = None,
+) -> tuple[list[dict[str, Any]] | None, Any, str | None]:
+    """调用模型并解码，返回 ``(commands, raw_response, failure_type)``。
+
+    调用或解码失败时记录日志，commands 为 None 并给出 failure_type；
+    ``log_text`` 用于日志里的 input_text，默认即请求文本。
+    """
+    input_text = text if log_text is None else log_text
     try:
         raw_response = client.ask(
             text,
@@ -191,21 +297,52 @@ def parse_commands(
             "command_parser.parse_failed",
             extra={
                 "failure_type": "llm_error",
-                "input_text": text,
+                "input_text": input_text,
             },
         )
-        return _fallback()
+        return None, None, "llm_error"
 
-    commands = _extract_json(raw_response)
+    commands = _decode_response(output_format, raw_response, allowed_categories)
     if commands is None:
         logger.warning(
             "command_parser.parse_failed",
             extra={
                 "failure_type": "json_parse_error",
-                "input_text": text,
+                "input_text": input_text,
                 "raw_response": _truncate_raw_response(raw_response),
             },
         )
+        return None, raw_response, "json_parse_error"
+
+    return commands, raw_response, None
+
+
+def parse_commands(
+    client: Any,
+    text: str,
+    *,
+    allowed_categories: set[str] | tuple[str, ...] = ALLOWED_CATEGORIES,
+    temperature: float = 0,
+    top_p: float = 0.9,
+    max_tokens: int = 512,
+    output_format: str = "json",
+) -> list[dict[str, Any]]:
+    # 紧凑格式按下标编码类型，需要固定顺序；校验时统一使用 set，避免线性查找。
+    allowed_categories_tuple = tuple(allowed_categories)
+    allowed_categories_set = set(allowed_categories_tuple)
+    system_prompt = _build_system_prompt(output_format, allowed_categories_tuple)
+
+    commands, raw_response, _ = _request_commands(
+        client,
+        text,
+        system_prompt=system_prompt,
+        output_format=output_format,
+        allowed_categories=allowed_categories_tuple,
+        temperature=temperature,
+        top_p=top_p,
+        max_tokens=max_tokens,
+    )
+    if commands is None:
         return _fallback()
 
     if not _validate_commands(commands, allowed_categories_set):
@@ -220,3 +357,246 @@ def parse_commands(
         return _fallback()
 
     return commands
+
+
+def _build_repair_prompt(text: str, invalid_items: list[dict[str, Any]]) -> str:
+    lines = [
+        f"用户指令：{text}",
+        "以下解析结果未通过校验，请只输出修正后的结果，条数与顺序保持不变：",
+    ]
+    for item in invalid_items:
+        lines.append(f"{compact_json_dumps(item['command'])} 错误：{','.join(item['errors'])}")
+    return "\n".join(lines)
+
+
+def _repair_commands(
+    client: Any,
+    text: str,
+    invalid_items: list[dict[str, Any]],
+    *,
+    allowed_categories: tuple[str, ...],
+    allowed_categories_set: set[str],
+    top_p: float,
+    max_tokens: int,
+) -> dict[int, dict[str, Any]]:
+    """只针对不合法的指令发起一次低 max_tokens 的修复请求，返回按原始下标索引的修复结果。
+
+    错误码使用 JSON 字段名，因此无论主请求用哪种输出格式，修复请求统一走 JSON 契约。
+    """
+    repaired, raw_response, _ = _request_commands(
+        client,
+        _build_repair_prompt(text, invalid_items),
+        system_prompt=_build_system_prompt("json", allowed_categories),
+        output_format="json",
+        allowed_categories=allowed_categories,
+        temperature=0,
+        top_p=top_p,
+        max_tokens=max_tokens * len(invalid_items),
+        log_text=text,
+    )
+    if repaired is None:
+        return {}
+
+    if len(repaired) != len(invalid_items):
+        logger.warning(
+            "command_parser.parse_failed",
+            extra={
+                "failure_type": "repair_failed",
+                "input_text": text,
+                "raw_response": _truncate_raw_response(raw_response),
+            },
+        )
+        return {}
+
+    return {
+        item["index"]: command
+        for item, command in zip(invalid_items, repaired)
+        if not _command_errors(command, allowed_categories_set)
+    }
+
+
+def _response_error(failure_type: str) -> dict[str, Any]:
+    return {"index": None, "command": None, "errors": [failure_type], "repaired": False}
+
+
+def parse_commands_partial(
+    client: Any,
+    text: str,
+    *,
+    allowed_categories: set[str] | tuple[str, ...] = ALLOWED_CATEGORIES,
+    temperature: float = 0,
+    top_p: float = 0.9,
+    max_tokens: int = 512,
+    output_format: str = "json",
+    repair: bool = True,
+    repair_max_tokens: int = 64,
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """保留合法指令，仅对不合法的指令发起修复请求。
+
+    返回 ``(commands, errors)``。``errors`` 中每项形如
+    ``{"index", "command", "errors", "repaired"}``：``index`` 为原始下标、``command`` 为
+    模型给出的原始指令，整体失败（llm_error/json_parse_error/empty）时两者均为 None；
+    ``errors`` 为错误码列表；``repaired`` 表示是否已修复并按原顺序放回 ``commands``。
+    没有任何可用指令时 ``commands`` 为标准 UNKNOWN 兜底。
+    """
+    allowed_categories_tuple = tuple(allowed_categories)
+    allowed_categories_set = set(allowed_categories_tuple)
+    system_prompt = _build_system_prompt(output_format, allowed_categories_tuple)
+
+    commands, raw_response, failure_type = _request_commands(
+        client,
+        text,
+        system_prompt=system_prompt,
+        output_format=output_format,
+        allowed_categories=allowed_categories_tuple,
+        temperature=temperature,
+        top_p=top_p,
+        max_tokens=max_tokens,
+    )
+    if commands is None:
+        return _fallback(), [_response_error(str(failure_type))]
+
+    if not commands:
+        logger.warning(
+            "command_parser.parse_failed",
+            extra={
+                "failure_type": "validation_failed",
+                "input_text": text,
+                "raw_response": _truncate_raw_response(raw_response),
+            },
+        )
+        return _fallback(), [_response_error("empty")]
+
+    invalid_items: list[dict[str, Any]] = []
+    for index, command in enumerate(commands):
+        errors = _command_errors(command, allowed_categories_set)
+        if errors:
+            invalid_items.append(
+                {"index": index, "command": command, "errors": errors, "repaired": False}
+            )
+
+    if not invalid_items:
+        return commands, []
+
+    logger.warning(
+        "command_parser.parse_failed",
+        extra={
+            "failure_type": "validation_failed",
+            "input_text": text,
+            "raw_response": _truncate_raw_response(raw_response),
+            "invalid_count": len(invalid_items),
+        },
+    )
+
+    repaired: dict[int, dict[str, Any]] = {}
+    if repair:
+        repaired = _repair_commands(
+            client,
+            text,
+            invalid_items,
+            allowed_categories=allowed_categories_tuple,
+            allowed_categories_set=allowed_categories_set,
+            top_p=top_p,
+            max_tokens=repair_max_tokens,
+        )
+
+    invalid_indexes = {item["index"] for item in invalid_items}
+    for item in invalid_items:
+        item["repaired"] = item["index"] in repaired
+
+    accepted: list[dict[str, Any]] = []
+    for index, command in enumerate(commands):
+        if index not in invalid_indexes:
+            accepted.append(command)
+        elif index in repaired:
+            accepted.append(repaired[index])
+
+    if not accepted:
+        return _fallback(), invalid_items
+
+    return accepted, invalid_items
+
+
+def _ask_for_measurement(
+    client: Any,
+    text: str,
+    count_tokens: Callable[[str], int] | None,
+    **kwargs: Any,
+) -> tuple[Any, int | None]:
+    # 优先使用客户端上报的真实输出 token 数，其次才用调用方提供的计数函数。
+    if hasattr(client, "ask_with_usage"):
+        raw_response, output_tokens = client.ask_with_usage(text, **kwargs)
+    else:
+        raw_response, output_tokens = client.ask(text, **kwargs), None
+
+    if output_tokens is None and count_tokens is not None:
+        output_tokens = count_tokens(str(raw_response))
+    return raw_response, output_tokens
+
+
+def measure_output_formats(
+    client: Any,
+    texts: Iterable[str],
+    *,
+    output_formats: tuple[str, ...] = OUTPUT_FORMATS,
+    allowed_categories: set[str] | tuple[str, ...] = ALLOWED_CATEGORIES,
+    temperature: float = 0,
+    top_p: float = 0.9,
+    max_tokens: int = 512,
+    count_tokens: Callable[[str], int] | None = None,
+) -> dict[str, dict[str, float]]:
+    """对同一批输入逐个格式请求模型，汇总输出 token、耗时与校验通过率。
+
+    ``output_tokens`` 来自客户端的 ``ask_with_usage``，没有时使用 ``count_tokens``；
+    只有 ``token_counted`` 条响应计入了 token 数。``output_chars`` 始终按字符统计。
+    失败调用的耗时单独记在 ``error_latency_ms``，不计入成功请求的平均耗时。
+    """
+    allowed_categories_tuple = tuple(allowed_categories)
+    allowed_categories_set = set(allowed_categories_tuple)
+    texts = list(texts)
+    report: dict[str, dict[str, float]] = {}
+
+    for output_format in output_formats:
+        system_prompt = _build_system_prompt(output_format, allowed_categories_tuple)
+        stats: dict[str, float] = {
+            "requests": 0,
+            "valid": 0,
+            "errors": 0,
+            "output_tokens": 0,
+            "token_counted": 0,
+            "output_chars": 0,
+            "total_latency_ms": 0.0,
+            "error_latency_ms": 0.0,
+        }
+        for text in texts:
+            stats["requests"] += 1
+            started = time.perf_counter()
+            try:
+                raw_response, output_tokens = _ask_for_measurement(
+                    client,
+                    text,
+                    count_tokens,
+                    system_prompt=system_prompt,
+                    temperature=temperature,
+                    top_p=top_p,
+                    max_tokens=max_tokens,
+                )
+            except Exception:
+                stats["errors"] += 1
+                stats["error_latency_ms"] += (time.perf_counter() - started) * 1000
+                continue
+            stats["total_latency_ms"] += (time.perf_counter() - started) * 1000
+
+            if output_tokens is not None:
+                stats["output_tokens"] += output_tokens
+                stats["token_counted"] += 1
+            stats["output_chars"] += len(str(raw_response))
+            commands = _decode_response(output_format, raw_response, allowed_categories_tuple)
+            if commands is not None and _validate_commands(commands, allowed_categories_set):
+                stats["valid"] += 1
+
+        succeeded = stats["requests"] - stats["errors"]
+        stats["mean_latency_ms"] = stats["total_latency_ms"] / succeeded if succeeded else 0.0
+        report[output_format] = stats
+
+    return report
@@ -1 +1,20 @@
 """Shared pytest fixtures for tests/."""
+
+from __future__ import annotations
+
+import pytest
+
+
+class FakeClock:
+    """可手动推进的单调时钟，替代 time.monotonic。"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def fake_clock() -> FakeClock:
+    return FakeClock()
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+from http import HTTPStatus
+from typing import Any
+
+import pytest
+
+from app.core.api_key_pool import ApiKeyPool, should_sideline
+from app.core.exceptions import QwenClientError
+
+
+def make_error(status_code: int, code: str = "Err") -> QwenClientError:
+    return QwenClientError(code=code, message="bad", status_code=status_code)
+
+
+def test_round_robin_cycles_through_keys() -> None:
+    pool = ApiKeyPool(["key-a", "key-b", "key-c"])
+
+    assert [pool.acquire() for _ in range(4)] == ["key-a", "key-b", "key-c", "key-a"]
+
+
+def test_quota_strategy_prefers_key_with_most_remaining_quota() -> None:
+    pool = ApiKeyPool(["key-a", "key-b"], strategy="quota", quotas={"key-a": 1, "key-b": 3})
+
+    assert [pool.acquire() for _ in range(3)] == ["key-b", "key-b", "key-a"]
+    assert pool.usage()["0:..."]["remaining_quota"] == 0
+
+
+def test_quota_strategy_skips_exhausted_keys() -> None:
+    pool = ApiKeyPool(["key-a", "key-b"], strategy="quota", quotas={"key-a": 1, "key-b": 1})
+
+    assert [pool.acquire() for _ in range(2)] == ["key-a", "key-b"]
+
+    pool = ApiKeyPool(["key-a", "key-b"], strategy="quota", quotas={"key-a": 0})
+    assert [pool.acquire() for _ in range(2)] == ["key-b", "key-b"]
+
+
+def test_exhausted_quotas_rotate_across_keys_instead_of_pinning_first() -> None:
+    keys = ["key-a", "key-b", "key-c"]
+    pool = ApiKeyPool(keys, strategy="quota", quotas={key: 1 for key in keys})
+
+    for _ in range(3):
+        pool.acquire()
+
+    assert sorted(pool.acquire() for _ in range(3)) == keys
+
+
+def test_quota_window_refills_remaining_quota(fake_clock: Any) -> None:
+    pool = ApiKeyPool(
+        ["key-a", "key-b"],
+        strategy="quota",
+        quotas={"key-a": 2, "key-b": 1},
+        quota_window_seconds=60,
+        clock=fake_clock,
+    )
+
+    assert [pool.acquire() for _ in range(3)] == ["key-a", "key-a", "key-b"]
+    assert pool.usage()["0:..."]["remaining_quota"] == 0
+
+    fake_clock.now = 60
+    assert pool.usage()["0:..."]["remaining_quota"] == 2
+    assert pool.acquire() == "key-a"
+    assert pool.usage()["0:..."]["requests"] == 3
+
+
+def test_set_remaining_quota_overrides_current_window() -> None:
+    pool = ApiKeyPool(["key-a", "key-b"], strategy="quota", quotas={"key-a": 5, "key-b": 5})
+
+    pool.set_remaining_quota("key-a", 0)
+
+    assert pool.acquire() == "key-b"
+    assert pool.usage()["0:..."]["remaining_quota"] == 0
+
+
+def test_sidelined_key_is_skipped_until_cooldown_expires(fake_clock: Any) -> None:
+    pool = ApiKeyPool(["key-a", "key-b"], cooldown_seconds=30, clock=fake_clock)
+
+    pool.report_failure("key-a", make_error(HTTPStatus.UNAUTHORIZED, "InvalidApiKey"))
+
+    assert [pool.acquire() for _ in range(2)] == ["key-b", "key-b"]
+    fake_clock.now = 31
+    assert pool.acquire() == "key-a"
+
+
+def test_all_keys_sidelined_falls_back_to_earliest_recovery(fake_clock: Any) -> None:
+    pool = ApiKeyPool(["key-a", "key-b"], cooldown_seconds=30, clock=fake_clock)
+
+    pool.report_failure("key-a", make_error(HTTPStatus.TOO_MANY_REQUESTS))
+    fake_clock.now = 5
+    pool.report_failure("key-b", make_error(HTTPStatus.TOO_MANY_REQUESTS))
+
+    assert pool.acquire() == "key-a"
+
+
+def test_usage_reports_masked_keys_and_counts() -> None:
+    pool = ApiKeyPool(["secret-1234"])
+
+    pool.acquire()
+    pool.report_failure("secret-1234", make_error(HTTPStatus.INTERNAL_SERVER_ERROR))
+
+    assert pool.usage() == {
+        "0:...1234": {
+            "requests": 1,
+            "failures": 1,
+            "remaining_quota": None,
+            "sidelined": False,
+        }
+    }
+
+
+def test_usage_keeps_keys_with_shared_suffix_apart_and_hides_short_keys() -> None:
+    pool = ApiKeyPool(["sk-aaaa1234", "sk-bbbb1234", "abcd"])
+
+    pool.acquire()
+
+    assert list(pool.usage()) == ["0:...1234", "1:...1234", "2:..."]
+    assert pool.usage()["0:...1234"]["requests"] == 1
+    assert pool.usage()["1:...1234"]["requests"] == 0
+
+
+@pytest.mark.parametrize(
+    "error,expected",
+    [
+        (make_error(HTTPStatus.TOO_MANY_REQUESTS), True),
+        (make_error(HTTPStatus.FORBIDDEN), True),
+        (make_error(HTTPStatus.BAD_REQUEST, "Throttling.RateQuota"), True),
+        (make_error(HTTPStatus.BAD_REQUEST, "Arrearage"), True),
+        (make_error(HTTPStatus.BAD_REQUEST, "InvalidParameter"), False),
+        (make_error(HTTPStatus.INTERNAL_SERVER_ERROR), False),
+    ],
+)
+def test_should_sideline_matches_quota_and_auth_errors(
+    error: QwenClientError, expected: bool
+) -> None:
+    assert should_sideline(error) is expected
+
+
+def test_pool_rejects_invalid_configuration() -> None:
+    with pytest.raises(ValueError):
+        ApiKeyPool([])
+    with pytest.raises(ValueError):
+        ApiKeyPool(["key-a"], strategy="random")
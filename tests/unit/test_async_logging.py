@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import logging
+import queue
+import time
+from typing import Any
+
+from app.core.async_logging import (
+    FailureLogThrottle,
+    ThrottledQueueHandler,
+    TokenBucket,
+    configure_async_failure_logging,
+)
+
+
+class CollectingHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: list[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+
+def make_record(failure_type: str) -> logging.LogRecord:
+    record = logging.LogRecord(
+        "app.services.command_parser",
+        logging.WARNING,
+        __file__,
+        1,
+        "command_parser.parse_failed",
+        None,
+        None,
+    )
+    record.failure_type = failure_type
+    return record
+
+
+def test_token_bucket_refills_over_time(fake_clock: Any) -> None:
+    bucket = TokenBucket(rate=1, capacity=2, clock=fake_clock)
+
+    assert bucket.consume()
+    assert bucket.consume()
+    assert not bucket.consume()
+
+    fake_clock.now = 1.0
+    assert bucket.consume()
+    assert not bucket.consume()
+
+
+def test_throttle_rate_limits_per_failure_type_and_reports_suppressed(
+    fake_clock: Any,
+) -> None:
+    throttle = FailureLogThrottle(rate=1, burst=1, clock=fake_clock)
+
+    assert throttle.filter(make_record("llm_error"))
+    assert not throttle.filter(make_record("llm_error"))
+    assert not throttle.filter(make_record("llm_error"))
+    assert throttle.filter(make_record("json_parse_error"))
+
+    fake_clock.now = 1.0
+    record = make_record("llm_error")
+    assert throttle.filter(record)
+    assert record.suppressed == 2
+    assert throttle.drain_suppressed() == {}
+
+
+def test_throttle_applies_sample_rate() -> None:
+    throttle = FailureLogThrottle(sample_rates={"llm_error": 0.5}, rng=lambda: 0.7)
+
+    assert not throttle.filter(make_record("llm_error"))
+    assert throttle.filter(make_record("validation_failed"))
+    assert throttle.drain_suppressed() == {"llm_error": 1}
+
+
+def test_queue_handler_drops_records_when_queue_is_full() -> None:
+    log_queue: queue.Queue[logging.LogRecord] = queue.Queue(maxsize=1)
+    throttle = FailureLogThrottle(rate=100, burst=100)
+    handler = ThrottledQueueHandler(log_queue, throttle)
+
+    handler.handle(make_record("llm_error"))
+    handler.handle(make_record("llm_error"))
+
+    assert log_queue.qsize() == 1
+    assert throttle.drain_suppressed() == {"llm_error": 1}
+
+
+def test_queue_handler_keeps_carried_suppressed_count_when_queue_is_full(
+    fake_clock: Any,
+) -> None:
+    log_queue: queue.Queue[logging.LogRecord] = queue.Queue(maxsize=1)
+    throttle = FailureLogThrottle(rate=1, burst=1, clock=fake_clock)
+    handler = ThrottledQueueHandler(log_queue, throttle)
+
+    handler.handle(make_record("llm_error"))
+    for _ in range(5):
+        handler.handle(make_record("llm_error"))
+
+    fake_clock.now = 1.0
+    handler.handle(make_record("llm_error"))
+
+    assert log_queue.qsize() == 1
+    assert throttle.drain_suppressed() == {"llm_error": 6}
+
+
+def test_queue_handler_appends_suppressed_count_to_message(fake_clock: Any) -> None:
+    log_queue: queue.Queue[logging.LogRecord] = queue.Queue()
+    throttle = FailureLogThrottle(rate=1, burst=1, clock=fake_clock)
+    handler = ThrottledQueueHandler(log_queue, throttle)
+
+    handler.handle(make_record("llm_error"))
+    handler.handle(make_record("llm_error"))
+    fake_clock.now = 1.0
+    handler.handle(make_record("llm_error"))
+
+    log_queue.get_nowait()
+    assert log_queue.get_nowait().getMessage() == "command_parser.parse_failed (1 suppressed)"
+
+
+def test_configure_async_failure_logging_delivers_records_and_restores_logger() -> None:
+    target = CollectingHandler()
+    logger = logging.getLogger("tests.async_logging")
+    configured = configure_async_failure_logging(target, logger_name="tests.async_logging")
+    try:
+        logger.warning("command_parser.parse_failed", extra={"failure_type": "llm_error"})
+    finally:
+        configured.stop()
+
+    assert [record.failure_type for record in target.records] == ["llm_error"]
+    assert logger.handlers == []
+    assert logger.propagate is True
+
+
+def test_configure_async_failure_logging_replaces_previous_configuration() -> None:
+    first = CollectingHandler()
+    second = CollectingHandler()
+    logger = logging.getLogger("tests.async_logging_twice")
+    configure_async_failure_logging(first, logger_name="tests.async_logging_twice")
+    configured = configure_async_failure_logging(second, logger_name="tests.async_logging_twice")
+    try:
+        logger.warning("command_parser.parse_failed", extra={"failure_type": "llm_error"})
+    finally:
+        configured.stop()
+
+    assert first.records == []
+    assert len(second.records) == 1
+    assert logger.propagate is True
+
+
+def test_stop_emits_summary_for_pending_suppressed_records() -> None:
+    target = CollectingHandler()
+    logger = logging.getLogger("tests.async_logging_summary")
+    configured = configure_async_failure_logging(
+        target, logger_name="tests.async_logging_summary", rate=0, burst=1
+    )
+    for _ in range(4):
+        logger.warning("command_parser.parse_failed", extra={"failure_type": "llm_error"})
+    configured.stop()
+
+    assert [record.getMessage() for record in target.records] == [
+        "command_parser.parse_failed",
+        "command_parser.suppressed (3 suppressed)",
+    ]
+    assert target.records[-1].failure_type == "llm_error"
+    assert target.records[-1].suppressed == 3
+
+
+def test_listener_flushes_suppressed_summary_on_timer() -> None:
+    target = CollectingHandler()
+    logger = logging.getLogger("tests.async_logging_timer")
+    configured = configure_async_failure_logging(
+        target,
+        logger_name="tests.async_logging_timer",
+        sample_rates={"llm_error": 0},
+        flush_interval=0.01,
+    )
+    try:
+        logger.warning("command_parser.parse_failed", extra={"failure_type": "llm_error"})
+        logger.warning("command_parser.parse_failed", extra={"failure_type": "llm_error"})
+        deadline = time.monotonic() + 2
+        while not target.records and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        configured.stop()
+
+    assert [record.getMessage() for record in target.records] == [
+        "command_parser.suppressed (2 suppressed)"
+    ]
+
+
+def test_stop_drains_full_queue_behind_slow_handler() -> None:
+    class SlowHandler(CollectingHandler):
+        def emit(self, record: logging.LogRecord) -> None:
+            time.sleep(0.02)
+            super().emit(record)
+
+    target = SlowHandler()
+    logger = logging.getLogger("tests.async_logging_slow")
+    configured = configure_async_failure_logging(
+        target, logger_name="tests.async_logging_slow", max_queue_size=2, rate=1000, burst=1000
+    )
+    for _ in range(20):
+        logger.warning("command_parser.parse_failed", extra={"failure_type": "llm_error"})
+
+    configured.stop()
+
+    assert configured.listener._thread is None
+    assert logger.propagate is True
+    summaries = [
+        record for record in target.records if record.msg.startswith("command_parser.suppressed")
+    ]
+    accounted = sum(
+        1 + getattr(record, "suppressed", 0)
+        for record in target.records
+        if record not in summaries
+    ) + sum(record.suppressed for record in summaries)
+    assert summaries
+    assert accounted == 20
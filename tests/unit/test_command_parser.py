@@ -7,6 +7,8 @@ import pytest
 
 from app.services.command_parser import (
     ALLOWED_CATEGORIES,
+    _command_errors,
+    _decode_compact,
     _extract_json,
     _fallback,
     _is_valid_action,
@@ -17,10 +19,25 @@ from app.services.command_parser import (
     _validate_command,
     _validate_commands,
     compact_json_dumps,
+    measure_output_formats,
     parse_commands,
+    parse_commands_partial,
 )
 
 
+class SequenceClient:
+    def __init__(self, *responses: str | Exception) -> None:
+        self._responses = list(responses)
+        self.calls: list[dict[str, Any]] = []
+
+    def ask(self, prompt: str, **kwargs: Any) -> str:
+        self.calls.append({"prompt": prompt, **kwargs})
+        response = self._responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
 class StubClient:
     def __init__(self, response: str | Exception) -> None:
         self._response = response
@@ -247,3 +264,231 @@ def test_parse_commands_falls_back_when_llm_returns_non_string(
     assert result == _fallback()
     record = next(rec for rec in caplog.records if rec.failure_type == "json_parse_error")
     assert record.raw_response == "{'unexpected': 'payload'}"
+
+
+def test_decode_compact_maps_codes_to_command_contract() -> None:
+    raw = "打开|客厅|灯|5|o\n关闭|*,!卧室|插座|SmartPlug|a|3\n"
+
+    parsed = _decode_compact(raw, ALLOWED_CATEGORIES)
+
+    assert parsed == [
+        {"a": "打开", "s": "客厅", "n": "灯", "t": "Light", "q": "one"},
+        {"a": "关闭", "s": "*,!卧室", "n": "插座", "t": "SmartPlug", "q": "all", "c": 3},
+    ]
+
+
+@pytest.mark.parametrize("raw", ["打开|客厅|灯", "打开|客厅|灯|5|o|三", {"a": "打开"}])
+def test_decode_compact_rejects_malformed_lines(raw: object) -> None:
+    assert _decode_compact(raw, ALLOWED_CATEGORIES) is None
+
+
+def test_parse_commands_compact_format_uses_compact_prompt() -> None:
+    client = StubClient("设置温度=26|卧室|空调|0|o")
+
+    result = parse_commands(client, "把卧室空调调到26度", output_format="compact")
+
+    assert result == [
+        {"a": "设置温度=26", "s": "卧室", "n": "空调", "t": "AirConditioner", "q": "one"}
+    ]
+    assert "0=AirConditioner" in client.calls[0]["system_prompt"]
+    assert "只输出 JSON 数组" not in client.calls[0]["system_prompt"]
+
+
+def test_parse_commands_compact_format_runs_same_validation(
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    client = StubClient("播放|客厅|灯|99|o")
+
+    with caplog.at_level(logging.WARNING):
+        result = parse_commands(client, "播放灯", output_format="compact")
+
+    assert result == _fallback()
+    record = next(rec for rec in caplog.records if rec.failure_type == "validation_failed")
+    assert record.raw_response == "播放|客厅|灯|99|o"
+
+
+@pytest.mark.parametrize("category_code", ["²", "①"])
+def test_parse_commands_compact_format_falls_back_on_non_ascii_digit_codes(
+    category_code: str,
+) -> None:
+    client = StubClient(f"打开|客厅|灯|{category_code}|o")
+
+    result = parse_commands(client, "打开客厅灯", output_format="compact")
+
+    assert result == _fallback()
+
+
+def test_parse_commands_rejects_unknown_output_format() -> None:
+    with pytest.raises(ValueError):
+        parse_commands(StubClient("[]"), "打开灯", output_format="xml")
+
+
+def test_measure_output_formats_reports_per_format_stats() -> None:
+    class FormatAwareClient:
+        def ask(self, prompt: str, **kwargs: Any) -> str:
+            if "只输出 JSON 数组" in kwargs["system_prompt"]:
+                return '[{"a":"打开","s":"客厅","n":"灯","t":"Light","q":"one"}]'
+            return "打开|客厅|灯|5|o"
+
+    report = measure_output_formats(FormatAwareClient(), ["打开客厅的灯", "开灯"])
+
+    assert set(report) == {"json", "compact"}
+    assert report["json"]["requests"] == 2
+    assert report["json"]["valid"] == 2
+    assert report["compact"]["valid"] == 2
+    assert report["compact"]["output_chars"] < report["json"]["output_chars"]
+    assert report["compact"]["mean_latency_ms"] >= 0
+
+
+def test_command_errors_reports_every_problem() -> None:
+    command = {"a": "播放", "s": "", "n": "灯", "t": "Robot", "x": 1}
+
+    errors = _command_errors(command, set(ALLOWED_CATEGORIES))
+
+    assert errors == [
+        "unknown_field:x",
+        "missing_field:q",
+        "invalid_a",
+        "invalid_s",
+        "invalid_t",
+    ]
+    assert _command_errors("not-object", set(ALLOWED_CATEGORIES)) == ["not_object"]
+
+
+def test_parse_commands_partial_keeps_valid_commands_and_repairs_invalid_ones() -> None:
+    raw = (
+        '[{"a":"打开","s":"客厅","n":"灯","t":"Light","q":"one"},'
+        '{"a":"关闭","s":"卧室","n":"空调","t":"Aircon","q":"one"}]'
+    )
+    repaired = '[{"a":"关闭","s":"卧室","n":"空调","t":"AirConditioner","q":"one"}]'
+    client = SequenceClient(raw, repaired)
+
+    commands, errors = parse_commands_partial(client, "打开客厅灯并关闭卧室空调")
+
+    assert commands == [
+        {"a": "打开", "s": "客厅", "n": "灯", "t": "Light", "q": "one"},
+        {"a": "关闭", "s": "卧室", "n": "空调", "t": "AirConditioner", "q": "one"},
+    ]
+    assert errors == [
+        {
+            "index": 1,
+            "command": {"a": "关闭", "s": "卧室", "n": "空调", "t": "Aircon", "q": "one"},
+            "errors": ["invalid_t"],
+            "repaired": True,
+        }
+    ]
+    repair_call = client.calls[1]
+    assert repair_call["max_tokens"] == 64
+    assert "invalid_t" in repair_call["prompt"]
+    assert '"n":"灯"' not in repair_call["prompt"]
+
+
+def test_parse_commands_partial_repairs_compact_output_through_json_contract() -> None:
+    raw = "打开|客厅|灯|5|o\n关闭|卧室|空调|99|o"
+    repaired = '[{"a":"关闭","s":"卧室","n":"空调","t":"AirConditioner","q":"one"}]'
+    client = SequenceClient(raw, repaired)
+
+    commands, errors = parse_commands_partial(
+        client, "打开客厅灯并关闭卧室空调", output_format="compact"
+    )
+
+    assert commands == [
+        {"a": "打开", "s": "客厅", "n": "灯", "t": "Light", "q": "one"},
+        {"a": "关闭", "s": "卧室", "n": "空调", "t": "AirConditioner", "q": "one"},
+    ]
+    assert errors[0]["index"] == 1
+    assert errors[0]["repaired"] is True
+    assert set(errors[0]) == {"index", "command", "errors", "repaired"}
+    assert "0=AirConditioner" in client.calls[0]["system_prompt"]
+    assert "只输出 JSON 数组" in client.calls[1]["system_prompt"]
+
+
+def test_parse_commands_partial_drops_unrepaired_commands() -> None:
+    raw = (
+        '[{"a":"打开","s":"客厅","n":"灯","t":"Light","q":"one"},'
+        '{"a":"播放","s":"客厅","n":"音箱","t":"NetworkAudio","q":"one"}]'
+    )
+    client = SequenceClient(raw, RuntimeError("boom"))
+
+    commands, errors = parse_commands_partial(client, "打开客厅灯再播放音乐")
+
+    assert commands == [{"a": "打开", "s": "客厅", "n": "灯", "t": "Light", "q": "one"}]
+    assert errors[0]["index"] == 1
+    assert errors[0]["errors"] == ["invalid_a"]
+    assert errors[0]["repaired"] is False
+
+
+def test_parse_commands_partial_without_repair_makes_single_call() -> None:
+    raw = '[{"a":"播放","s":"客厅","n":"音箱","t":"NetworkAudio","q":"one"}]'
+    client = SequenceClient(raw)
+
+    commands, errors = parse_commands_partial(client, "播放音乐", repair=False)
+
+    assert commands == _fallback()
+    assert len(client.calls) == 1
+    assert errors[0]["index"] == 0
+
+
+def test_parse_commands_partial_reports_whole_response_failure() -> None:
+    client = SequenceClient("这是错误输出")
+
+    commands, errors = parse_commands_partial(client, "打开灯")
+
+    assert commands == _fallback()
+    assert errors == [
+        {"index": None, "command": None, "errors": ["json_parse_error"], "repaired": False}
+    ]
+
+
+def test_parse_commands_partial_reports_non_string_response_as_json_parse_error() -> None:
+    client = StubClient(None)
+
+    commands, errors = parse_commands_partial(client, "打开灯")
+
+    assert commands == _fallback()
+    assert errors[0]["errors"] == ["json_parse_error"]
+
+
+def test_parse_commands_partial_logs_repair_failure_with_user_text(
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    raw = '[{"a":"播放","s":"客厅","n":"音箱","t":"NetworkAudio","q":"one"}]'
+    client = SequenceClient(raw, RuntimeError("boom"))
+
+    with caplog.at_level(logging.WARNING):
+        parse_commands_partial(client, "播放音乐")
+
+    record = next(rec for rec in caplog.records if rec.failure_type == "llm_error")
+    assert record.input_text == "播放音乐"
+
+
+def test_measure_output_formats_prefers_client_reported_tokens() -> None:
+    class UsageClient:
+        def ask_with_usage(self, prompt: str, **kwargs: Any) -> tuple[str, int]:
+            if "只输出 JSON 数组" in kwargs["system_prompt"]:
+                return '[{"a":"打开","s":"客厅","n":"灯","t":"Light","q":"one"}]', 30
+            return "打开|客厅|灯|5|o", 9
+
+    report = measure_output_formats(UsageClient(), ["开灯"], count_tokens=len)
+
+    assert report["json"]["output_tokens"] == 30
+    assert report["compact"]["output_tokens"] == 9
+    assert report["compact"]["token_counted"] == 1
+
+
+def test_measure_output_formats_uses_count_tokens_and_separates_error_latency() -> None:
+    client = SequenceClient("打开|客厅|灯|5|o", RuntimeError("timeout"))
+
+    report = measure_output_formats(
+        client,
+        ["开灯", "开灯"],
+        output_formats=("compact",),
+        count_tokens=lambda raw: raw.count("|"),
+    )
+
+    stats = report["compact"]
+    assert stats["output_tokens"] == 4
+    assert stats["token_counted"] == 1
+    assert stats["errors"] == 1
+    assert stats["error_latency_ms"] >= 0
+    assert stats["mean_latency_ms"] == stats["total_latency_ms"]
@@ -5,6 +5,7 @@ from typing import Any, Callable
 
 import pytest
 
+from app.core.api_key_pool import ApiKeyPool
 from app.core.exceptions import QwenClientError
 from app.core.qwen_client import QwenClient
 
@@ -24,6 +25,11 @@ class DummyOutput:
         self.choices = [DummyChoice(content)]
 
 
+class DummyUsage:
+    def __init__(self, output_tokens: int | None) -> None:
+        self.output_tokens = output_tokens
+
+
 class DummyResponse:
     def __init__(
         self,
@@ -32,11 +38,13 @@ class DummyResponse:
         content: str = "ok",
         code: str = "ERR",
         message: str = "bad",
+        output_tokens: int | None = None,
     ) -> None:
         self.status_code = status_code
         self.output = DummyOutput(content)
         self.code = code
         self.message = message
+        self.usage = DummyUsage(output_tokens)
 
 
 def make_stub(
@@ -149,3 +157,51 @@ def test_chat_raises_on_non_ok_status() -> None:
     assert exc_info.value.code == "Bad"
     assert exc_info.value.message == "oops"
     assert exc_info.value.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_chat_passes_api_key_per_request() -> None:
+    capture: dict[str, Any] = {}
+    stub = make_stub(capture, DummyResponse(HTTPStatus.OK))
+    client = QwenClient(api_key="test", generation_call=stub)
+
+    client.chat([{"role": "user", "content": "Hi"}])
+
+    assert capture["api_key"] == "test"
+
+
+def test_chat_rotates_keys_from_pool_and_sidelines_failing_key() -> None:
+    used_keys: list[str] = []
+    responses = [
+        DummyResponse(HTTPStatus.TOO_MANY_REQUESTS, code="Throttling", message="slow"),
+        DummyResponse(HTTPStatus.OK),
+        DummyResponse(HTTPStatus.OK),
+    ]
+
+    def _call(**kwargs: Any) -> DummyResponse:
+        used_keys.append(kwargs["api_key"])
+        return responses.pop(0)
+
+    pool = ApiKeyPool(["key-a", "key-b"])
+    client = QwenClient(generation_call=_call, api_key_pool=pool)
+
+    with pytest.raises(QwenClientError):
+        client.ask("Hi")
+    client.ask("Hi")
+    client.ask("Hi")
+
+    assert used_keys == ["key-a", "key-b", "key-b"]
+    assert pool.usage()["0:..."]["sidelined"] is True
+
+
+def test_init_rejects_api_key_together_with_pool() -> None:
+    with pytest.raises(ValueError):
+        QwenClient(api_key="test", api_key_pool=ApiKeyPool(["key-a"]))
+
+
+def test_ask_with_usage_returns_output_tokens() -> None:
+    capture: dict[str, Any] = {}
+    stub = make_stub(capture, DummyResponse(HTTPStatus.OK, content="ok", output_tokens=7))
+    client = QwenClient(api_key="test", generation_call=stub)
+
+    assert client.ask_with_usage("Hello") == ("ok", 7)
+    assert capture["messages"] == [{"role": "user", "content": "Hello"}]